@@ -1,4 +1,4 @@
 # Description: Install all the required packages for the project
 #!/bin/bash
 
-pip install ipython langchain langchain_community langchain_core langchain_ollama langchain_openai langgraph pydantic typing_extensions
+pip install ipython langchain langchain_community langchain_core langchain_ollama langchain_openai langgraph orjson pydantic typing_extensions
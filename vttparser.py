@@ -1,87 +1,127 @@
+import io
 import json
+import os
 import re
+import stat
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import groupby
+from operator import attrgetter
+from sys import intern, platform
+
+try:
+    # orjson is optional, it makes writing the JSON output much faster when it is installed.
+    import orjson
+except ImportError:
+    orjson = None
+
+# Regex patterns for validating timecodes and IDs, compiled once when the module is loaded.
+# Lines are first classified with cheap string tests, so the regexes only run on likely candidates.
+TIMECODE_RE = re.compile(r"(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})")
+ID_RE = re.compile(r"^([\w-]+\/[\d-]+)")
+# Markers that open and close a speaker block.
+SPEAKER_BLOCK_START = "<v "
+SPEAKER_BLOCK_END = "</v>"
+# The JSON output is buffered in proportion to the size of its input, up to this limit, to cut the number of writes.
+MAX_OUTPUT_BUFFER_SIZE = 16 * 1024 * 1024
+# ProcessPoolExecutor refuses more than 61 worker processes on Windows, other platforms have no fixed limit.
+MAX_BATCH_JOBS = 61 if platform == "win32" else None
+
+# The VTTRecord class holds a single parsed VTT block.
+# It uses slots rather than a dictionary, which makes records cheaper to create and to read (slots=True needs Python 3.10+).
+@dataclass(slots=True)
+class VTTRecord:
+    """
+    A single record parsed from a VTT block.
+
+    The text is gathered into text_parts while the block is read, and joined on demand by the text property.
+    """
+    id: str | None = None
+    event_id: str | None = None
+    sequence: str | None = None
+    start: str | None = None
+    end: str | None = None
+    speaker: str | None = None
+    text_parts: list = field(default_factory=list)
+    # Numeric forms of event_id and sequence, converted once while parsing so sorting doesn't have to.
+    event_number: int | None = None
+    sequence_number: int | None = None
+
+    @property
+    def text(self):
+        """The captured transcription text, with its parts joined by single spaces."""
+        return " ".join(self.text_parts)
 
 # The parse_vtt function is responsible for parsing a Microsoft Teams VTT file into individual records.
 # Each record contains metadata (like id, event_id, sequence, start/end time) and text content, including speaker information.
 def parse_vtt(file_path):
     """
-    Parses a VTT file into individual records.
+    Parses a VTT file into individual VTTRecord objects.
     
     The expected record structure includes:
     - id: Unique identifier extracted from the VTT block label.
     - event_id: Derived from the id to represent the event.
     - sequence: Sequence id parsed from the id.
+    - event_number, sequence_number: The event_id and sequence as integers, used for sorting.
     - start: Start time extracted from the timecode line.
     - end: End time extracted from the timecode line.
     - speaker: Speaker identifier if available.
     - text: Captured transcription text.
     """
     records = []
-    # Initialize an empty record structure with default values.
-    current_record = {
-        "id": None,
-        "event_id": None,
-        "sequence": None,
-        "start": None,
-        "end": None,
-        "speaker": None,
-        "text": "",
-    }
-    # Compile regex patterns for matching timecodes, IDs, and speaker tags.
-    timecode_regex = re.compile(r"(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})")
-    id_regex = re.compile(r"^([\w-]+\/[\d-]+)")
-    speaker_block_start = re.compile(r"<v (.+?)>")
-    speaker_block_end = "</v>"
-
+    # Initialize an empty record with default values.
+    current_record = VTTRecord()
+    # The speaker of the current record is also kept in a local, which is cheaper to test on every line.
+    current_speaker = None
     # Open the VTT file, read it line by line.
+    # Buffered line iteration is kept on purpose: splitting a memory-mapped copy of the file on blank lines
+    # was measured to be slower, because each block still has to be classified line by line.
     with open(file_path, 'r', encoding='utf-8') as file:
         for line in file:
             # Remove leading/trailing whitespace.
             line = line.strip()
             # An empty line indicates the end of a record.
             if not line:
-                if current_record["start"] is not None:
-                    # Append a copy of the current record to the records list.
-                    records.append(current_record.copy())
-                    # Reset the current record for the next block.
-                    current_record = {
-                        "id": None,
-                        "event_id": None,
-                        "sequence": None,
-                        "start": None,
-                        "end": None,
-                        "speaker": None,
-                        "text": "",
-                    }
+                if current_record.start is not None:
+                    # Append the current record to the records list.
+                    records.append(current_record)
+                    # Start a fresh record for the next block.
+                    current_record = VTTRecord()
+                    current_speaker = None
             # Check if the line contains an identifier for the record.
-            elif id_match := id_regex.match(line):
-                current_record["id"] = id_match.group(1)
+            # Identifiers contain a "/" and never a space, so other lines skip the regex entirely.
+            elif "/" in line and " " not in line and (id_match := ID_RE.match(line)):
+                current_record.id = id_match.group(1)
                 # Extract event_id and sequence information from the id string.
-                event_id, sequence_info = id_match.group(1).split("/")[1].split("-")
-                current_record["event_id"] = event_id
-                current_record["sequence"] = sequence_info
+                current_record.event_id, current_record.sequence = id_match.group(1).split("/")[1].split("-")
+                current_record.event_number = int(current_record.event_id)
+                current_record.sequence_number = int(current_record.sequence)
             # Check for the presence of the timecode line.
-            elif timecode_match := timecode_regex.match(line):
+            elif " --> " in line and (timecode_match := TIMECODE_RE.match(line)):
                 # Capture the start and end times.
-                current_record["start"], current_record["end"] = timecode_match.groups()
+                current_record.start, current_record.end = timecode_match.groups()
             # Check for speaker info using the <v ...> tag.
-            elif speaker_start := speaker_block_start.match(line):
-                # Set the speaker identifier.
-                current_record["speaker"] = speaker_start.group(1)
-                # Determine if the text is confined to the same line (enclosed by </v>) or continues across lines.
-                if speaker_block_end in line:
-                    current_record["text"] += line.split(">", 1)[1].split("</v>", 1)[0].strip() + " "
-                else:
-                    # Append text from the current line after the speaker block.
-                    current_record["text"] += line.split(">", 1)[1].strip() + " "
-            elif current_record.get("speaker"):
+            elif line.startswith(SPEAKER_BLOCK_START) and (speaker_end := line.find(">", 4)) != -1:
+                # Set the speaker identifier, which sits between "<v " and the closing ">".
+                # Names are interned, as a meeting has few speakers: records share one string per speaker,
+                # and comparing speakers during collation can short-circuit on identity.
+                current_speaker = current_record.speaker = intern(line[3:speaker_end])
+                # The text runs from the end of the tag to </v> if it is confined to the same line,
+                # or to the end of the line if it continues across lines.
+                # Empty text, such as from a <v Speaker></v> cue, is skipped so it can't leave doubled spaces when joined.
+                text_end = line.find(SPEAKER_BLOCK_END, speaker_end + 1)
+                if text := line[speaker_end + 1:text_end if text_end != -1 else None].strip():
+                    current_record.text_parts.append(text)
+            elif current_speaker is not None:
                 # For lines after the speaker tag that still belong to the same speaker block.
-                # The block end marker is removed if present.
-                current_record["text"] += line.split("</v>", 1)[0].strip() + " "
+                # The block end marker is removed if present, and a line holding only the marker adds no text.
+                text_end = line.find(SPEAKER_BLOCK_END)
+                if text := (line[:text_end].strip() if text_end != -1 else line):
+                    current_record.text_parts.append(text)
 
     # Append the last record if it hasn't been added yet.
-    if current_record["start"] is not None:
-        records.append(current_record.copy())
+    if current_record.start is not None:
+        records.append(current_record)
 
     return records
 
@@ -92,151 +132,254 @@ def sort_records(records):
     
     This ensures that records are processed in the right time order.
     """
-    return sorted(records, key=lambda r: (int(r["event_id"]), int(r["sequence"])))
-
-# The collate_records function aggregates records based on their event_id.
-# When multiple records share the same event_id, their text content is concatenated.
-def collate_records(records):
-    """
-    Collates sorted records into single blocks by event ID.
-    
-    For records with the same event_id, combine the text contents and update the end time.
-    """
-    collated = {}
-    for record in records:
-        event_id = record["event_id"]
-        if event_id in collated:
-            # Append text from the current record.
-            collated[event_id]["text"] += " " + record["text"]
-            # The end timestamp is updated to the most recent record's end time.
-            collated[event_id]["end"] = record["end"]
-        else:
-            # Create a new entry if the event_id is not already in the collated dictionary.
-            collated[event_id] = {
-                "id": record["id"],
-                "event_id": event_id,
-                "start": record["start"],
-                "end": record["end"],
-                "speaker": record["speaker"],
-                "text": record["text"],
-            }
+    return sorted(records, key=attrgetter("event_number", "sequence_number"))
 
-    # Return a list of collated record dictionaries.
-    return list(collated.values())
-
-# The collate_records_v2 function further collates records from a sorted list.
-# It checks if the speaker in subsequent records is the same, allowing multiple events by the same speaker to be combined.
+# The collate_records_v2 function collates records from a sorted list in a single pass.
+# Records that share an event_id are combined, and consecutive events by the same speaker are combined with them.
 # A new field "collated_events" is added to track the originating event_ids.
+# Collated records are yielded one at a time as soon as they are complete, so the full result never has to be held in memory.
 def collate_records_v2(records):
     """
-    Further collates sorted records by checking speaker consistency.
-    
-    If subsequent records have the same speaker, merge them into one record and record all collated event_ids.
-    The initial event_id is retained as the main event_id.
+    Collates sorted records into blocks by event ID and speaker consistency, yielding each block when it is complete.
+
+    Records with the same event_id always belong to the same block, and the speaker of an event is taken
+    from its first record. If subsequent events have the same speaker, merge them into one record and
+    record all collated event_ids. The initial event_id is retained as the main event_id.
     """
-    collated = []
     current_collation = None
-    for record in records:
-        if current_collation is None:
-            # Initialize a new collation block with the details of the first record.
-            current_collation = {
-                "id": record["id"],
-                "event_id": record["event_id"],
-                "start": record["start"],
-                "end": record["end"],
-                "speaker": record["speaker"],
-                "text": record["text"],
-                "collated_events": [record["event_id"]],
-            }
-        elif current_collation["speaker"] == record["speaker"]:
-            # If the speaker remains the same, merge the text and update the end time.
-            current_collation["text"] += " " + record["text"]
-            current_collation["end"] = record["end"]
-            current_collation["collated_events"].append(record["event_id"])
+    # The records are sorted by event, so groupby hands over each event's records as one contiguous group.
+    for event_id, event_records in groupby(records, key=attrgetter("event_id")):
+        event_records = list(event_records)
+        first_record = event_records[0]
+        if current_collation is not None and current_collation["speaker"] == first_record.speaker:
+            # If the speaker remains the same for a new event, merge it into the current collation.
+            current_collation["collated_events"].append(event_id)
         else:
-            # When the speaker changes, finalize the current collation and start a new one.
-            collated.append(current_collation)
+            if current_collation is not None:
+                # The speaker has changed, so the current collation is complete: join its text and yield it.
+                current_collation["text"] = " ".join(current_collation["text"])
+                yield current_collation
+            # The first event, or a new event by a different speaker, starts a new collation.
             current_collation = {
-                "id": record["id"],
-                "event_id": record["event_id"],
-                "start": record["start"],
-                "end": record["end"],
-                "speaker": record["speaker"],
-                "text": record["text"],
-                "collated_events": [record["event_id"]],
+                "id": first_record.id,
+                "event_id": event_id,
+                "start": first_record.start,
+                "end": None,
+                "speaker": first_record.speaker,
+                # The text is gathered as a list of parts and joined once the collation is complete.
+                "text": [],
+                "collated_events": [event_id],
             }
+        # Every record of the event contributes its text, and the end time comes from its last record.
+        for record in event_records:
+            current_collation["text"].extend(record.text_parts)
+        current_collation["end"] = event_records[-1].end
 
-    if current_collation:
-        # Append any remaining collation.
-        collated.append(current_collation)
-
-    return collated
+    if current_collation is not None:
+        # Yield any remaining collation.
+        current_collation["text"] = " ".join(current_collation["text"])
+        yield current_collation
 
-# The process_vtt_to_dictionary function orchestrates the whole process:
-# It parses the VTT file, sorts the records, collates them twice (first by event and then by speaker),
-# and returns a final list of dictionaries ready for JSON conversion.
-def process_vtt_to_dictionary(vtt_file_path):
+# The iter_collated function parses and sorts a VTT file, and returns an iterator over its collated records.
+# Parsing and sorting happen straight away, so errors in the input are raised before any output is written.
+def iter_collated(vtt_file_path):
     """
-    Processes a VTT file into a dictionary structure.
-    
+    Returns an iterator that produces the collated records of a VTT file one at a time.
+
     Steps involved:
     1. Parse the VTT file to get individual records.
     2. Sort the records by event_id and sequence.
-    3. Collate records by event_id.
-    4. Further collate records by speaker.
-    5. Return the final structured list.
+    3. Collate records by event_id and speaker as the iterator is consumed.
     """
     records = parse_vtt(vtt_file_path)  # Parse records
     sorted_records = sort_records(records)  # Sort records by event_id and sequence_id
-    collated_records = collate_records(sorted_records)  # Collate by event_id
-    # Sort the final collated records by event_id (in numeric order)
-    final_sorted_records = sorted(collated_records, key=lambda r: int(r["event_id"]))
-    return_value = collate_records_v2(final_sorted_records)
-    return return_value
+    return collate_records_v2(sorted_records)  # Collate by event_id and speaker
+
+# The process_vtt_to_dictionary function orchestrates the whole process:
+# It parses the VTT file, sorts the records, collates them by event and speaker in one pass,
+# and returns a final list of dictionaries ready for JSON conversion.
+def process_vtt_to_dictionary(vtt_file_path):
+    """
+    Processes a VTT file into a dictionary structure.
+
+    This collects every record produced by iter_collated into the final structured list.
+    """
+    return list(iter_collated(vtt_file_path))
+
+# The encode_record function serialises a single collated record to UTF-8 encoded JSON.
+# orjson is used when it is available, otherwise the standard json module produces the same output.
+def encode_record(record):
+    """
+    Encodes a collated record as JSON bytes, pretty printed with an indent of two spaces.
+    """
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_INDENT_2)
+    return json.dumps(record, ensure_ascii=False, indent=2).encode('utf-8')
 
 # The process_vtt_to_json function drives the conversion from a VTT file to a structured JSON file.
-# It uses process_vtt_to_dictionary to process the file and then writes out the results to the given JSON path.
-def process_vtt_to_json(vtt_file_path, output_json_path):
+# It streams the records from iter_collated and writes them out to the given JSON path one at a time.
+def process_vtt_to_json(vtt_file_path, output_json_path, input_size=None):
     """
     Processes a VTT file and saves the structured output as a JSON file.
 
-    This involves parsing, sorting, collating, and then dumping the data in JSON format.
+    This involves parsing, sorting, collating, and then writing the data in JSON format.
+    Only one collated record is held in memory at a time, and each is encoded by encode_record.
+    input_size is the size of the VTT file in bytes, used to size the output buffer; it is looked up if not given.
+    """
+    collated_records = iter_collated(vtt_file_path)
+    if input_size is None:
+        input_size = os.stat(vtt_file_path).st_size
+    buffer_size = min(max(io.DEFAULT_BUFFER_SIZE, input_size), MAX_OUTPUT_BUFFER_SIZE)
+    # Write the results to a JSON file with pretty printing enabled, one record at a time.
+    with open(output_json_path, 'wb', buffering=buffer_size) as json_file:
+        separator = b"[\n  "
+        for record in collated_records:
+            json_file.write(separator)
+            # Indent each record by one level, as it sits inside the top-level list.
+            # JSON escapes newlines inside strings, so only the layout newlines are affected.
+            json_file.write(encode_record(record).replace(b"\n", b"\n  "))
+            separator = b",\n  "
+        # Close the list, writing an empty list if there were no records.
+        json_file.write(b"[]" if separator == b"[\n  " else b"\n]")
+
+# The list_vtt_batch function pairs every VTT file in a directory with the JSON file it converts to.
+# Each output file takes the name of its VTT file, with a .json extension, inside the output directory.
+def list_vtt_batch(input_dir, output_dir):
+    """
+    Lists the (VTT path, JSON path) pairs for converting every .vtt file in input_dir into output_dir.
+
+    Only the top level of input_dir is searched, and the pairs are sorted by file name.
+    Raises ValueError if two VTT files would convert to the same JSON file, or to names that only differ by case,
+    such as "m.vtt" and "m.VTT".
     """
-    results = process_vtt_to_dictionary(vtt_file_path)
-    # Write the results to a JSON file with pretty printing enabled.
-    with open(output_json_path, 'w', encoding='utf-8') as json_file:
-        json.dump(results, json_file, ensure_ascii=False, indent=4)
+    batch = [
+        (os.path.join(input_dir, name), os.path.join(output_dir, os.path.splitext(name)[0] + ".json"))
+        for name in sorted(os.listdir(input_dir))
+        if name.lower().endswith(".vtt") and os.path.isfile(os.path.join(input_dir, name))
+    ]
+    # Two workers writing the same output file would overwrite or corrupt each other's results.
+    # The paths are compared casefolded, as names that only differ by case are the same file
+    # on case-insensitive filesystems such as the macOS and Windows defaults.
+    outputs = {}
+    for vtt_path, json_path in batch:
+        existing_vtt_path = outputs.setdefault(json_path.casefold(), vtt_path)
+        if existing_vtt_path != vtt_path:
+            raise ValueError(f"'{existing_vtt_path}' and '{vtt_path}' would both be converted to '{json_path}'.")
+    return batch
+
+# The process_vtt_batch function converts a whole directory of VTT files into JSON files.
+# Each file is independent, so they are converted in parallel by a pool of worker processes, which avoids the GIL.
+def process_vtt_batch(input_dir, output_dir, jobs=None):
+    """
+    Processes every VTT file in input_dir and saves each structured output as a JSON file in output_dir.
+
+    The output directory is created if needed. jobs sets the number of worker processes, and defaults
+    to the executor's own choice, based on the number of CPUs. Returns the list of JSON paths that were written.
+    """
+    batch = list_vtt_batch(input_dir, output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    if not batch:
+        return []
+    vtt_paths, json_paths = zip(*batch)
+    # Without jobs the executor picks its own default, which respects the platform's limit.
+    # There's no point starting more workers than there are files to convert.
+    workers = min(jobs, len(batch)) if jobs else None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Consuming the results re-raises any error from a worker here.
+        list(executor.map(process_vtt_to_json, vtt_paths, json_paths))
+    return list(json_paths)
 
 # The main function serves as the entry point when the program is executed from the command line.
-# It validates the input and output file paths, checks for file existence, and requests user confirmation for overwriting.
+# It validates the input and output paths, checks for file existence, and requests user confirmation for overwriting.
+# A directory of VTT files can be given instead of a single file, optionally with --jobs to set the number of workers.
 def main():
     import sys
-    import os
 
     # Display invocation information for debugging purposes.
     print(f"VTT Parser {sys.argv}")
 
+    usage = ("Usage: python vttparser.py <input_vtt_file> <output_json_file>\n"
+             "       python vttparser.py [--jobs N] <input_vtt_dir> <output_json_dir>")
+    args = sys.argv[1:]
+
+    # Read the optional number of worker processes used for a directory of files.
+    jobs = None
+    if args and args[0] == "--jobs":
+        # isdecimal only accepts the digits that int() can parse, unlike isdigit which also accepts "²".
+        if len(args) < 2 or not args[1].isdecimal() or int(args[1]) < 1:
+            print("Error: --jobs must be followed by a positive number.")
+            print(usage)
+            sys.exit(1)
+        jobs = int(args[1])
+        if MAX_BATCH_JOBS is not None and jobs > MAX_BATCH_JOBS:
+            print(f"Error: --jobs can be at most {MAX_BATCH_JOBS} on this platform.")
+            print(usage)
+            sys.exit(1)
+        args = args[2:]
+
     # Check for correct number of command-line arguments.
-    if len(sys.argv) != 3:
-        print("Usage: python vttparser.py <input_vtt_file> <output_json_file>")
+    if len(args) != 2:
+        print(usage)
+        sys.exit(1)
+
+    input_file = args[0]
+    output_file = args[1]
+
+    # Validate that the input VTT file exists, a single stat call also gives its type and size.
+    try:
+        input_stat = os.stat(input_file)
+    except OSError as error:
+        # A missing file keeps the familiar message, other failures (such as permissions) report their cause.
+        if isinstance(error, FileNotFoundError):
+            print(f"Error: Input file '{input_file}' does not exist.")
+        else:
+            print(f"Error: Input file '{input_file}' cannot be read: {error.strerror}.")
         sys.exit(1)
 
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
+    if stat.S_ISDIR(input_stat.st_mode):
+        # The output for a directory of VTT files must be a directory too.
+        if os.path.exists(output_file) and not os.path.isdir(output_file):
+            print(f"Error: Output '{output_file}' must be a directory when the input is a directory.")
+            sys.exit(1)
+
+        # Pair each VTT file with its output, refusing names that would clash on the same JSON file.
+        try:
+            batch = list_vtt_batch(input_file, output_file)
+        except ValueError as error:
+            print(f"Error: {error}")
+            sys.exit(1)
 
-    # Validate that the input VTT file exists.
-    if not os.path.exists(input_file):
-        print(f"Error: Input file '{input_file}' does not exist.")
+        # If any of the output files already exist, prompt the user once for permission to overwrite them.
+        # The paths are collected in a set, so each existing file is only counted once.
+        existing = {json_path for _, json_path in batch if os.path.lexists(json_path)}
+        if existing:
+            choice = input(f"{len(existing)} output file(s) in '{output_file}' already exist. Overwrite? (y/n): ")
+            if choice.lower() != "y":
+                sys.exit(0)
+
+        # Process every VTT file in the directory and write the results to the output directory.
+        written = process_vtt_batch(input_file, output_file, jobs)
+        print(f"Converted {len(written)} VTT file(s) into '{output_file}'.")
+        return
+
+    # The number of workers only applies to a directory of files, so reject it for a single file.
+    if jobs is not None:
+        print("Error: --jobs can only be used when the input is a directory.")
+        print(usage)
         sys.exit(1)
 
+    # Display the input size for diagnostic purposes.
+    print(f"Input file '{input_file}' is {input_stat.st_size} bytes.")
+
     # If the output file already exists, prompt the user for permission to overwrite it.
-    if os.path.exists(output_file):
+    # lexists also catches an output path that is a broken symbolic link.
+    if os.path.lexists(output_file):
         choice = input(f"Output file '{output_file}' already exists. Overwrite? (y/n): ")
         if choice.lower() != "y":
             sys.exit(0)
 
     # Process the VTT file and write the results to the output JSON file.
-    process_vtt_to_json(input_file, output_file)
+    process_vtt_to_json(input_file, output_file, input_stat.st_size)
 
 # Execute the main function if this script is run as the main module.
 if __name__ == "__main__":